@@ -0,0 +1,433 @@
+import asyncio
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, quote
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Largest value SQLite can bind as an INTEGER
+MAX_SQLITE_INT = 2**63 - 1
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def db_uri(db_path, mode):
+    return f"file:{quote(os.path.abspath(db_path))}?mode={mode}"
+
+
+def enable_wal(db_path):
+    # WAL is persistent on the database file, so readers never block the crawler's writes
+    # mode=rw refuses to create an empty database when the path is wrong
+    conn = sqlite3.connect(db_uri(db_path, 'rw'), uri=True)
+    mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+    conn.close()
+    logging.info(f"Database journal mode is {mode} 📒")
+
+
+def open_read_only(db_path):
+    conn = sqlite3.connect(db_uri(db_path, 'ro'), uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ConnectionPool:
+    """A fixed set of read-only connections shared by the request handlers."""
+
+    def __init__(self, db_path, size):
+        self.connections = [open_read_only(db_path) for _ in range(size)]
+        self.idle = asyncio.Queue()
+        for conn in self.connections:
+            self.idle.put_nowait(conn)
+
+    async def run(self, func, *args):
+        # Queries run in a worker thread so a slow one does not stall the event loop
+        conn = await self.idle.get()
+        future = asyncio.get_running_loop().run_in_executor(None, func, conn, *args)
+        # Hand the connection back only once the thread is done with it, even if this task is cancelled
+        future.add_done_callback(lambda _: self.idle.put_nowait(conn))
+        return await asyncio.shield(future)
+
+    async def close(self):
+        # Wait for queries still running in worker threads before closing their connections
+        for _ in self.connections:
+            await self.idle.get()
+        for conn in self.connections:
+            conn.close()
+
+
+class ResultCache:
+    """LRU of rendered responses, dropped whenever the database reports a new commit."""
+
+    def __init__(self, db_path, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # PRAGMA data_version changes on this connection each time another connection commits
+        self.watcher = open_read_only(db_path)
+        self.version = self.current_version()
+        self.hits = 0
+        self.misses = 0
+
+    def current_version(self):
+        return self.watcher.execute('PRAGMA data_version').fetchone()[0]
+
+    def check_version(self):
+        version = self.current_version()
+        if version != self.version:
+            logging.info(f"Database changed, dropping {len(self.entries)} cached results ({self.hits} hits, {self.misses} misses so far) 🔄")
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key):
+        # Returns the version seen alongside the hit, so a miss can be stored against it
+        self.check_version()
+        key = (self.version, key)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.version, self.entries[key]
+        self.misses += 1
+        return self.version, None
+
+    def put(self, version, key, value):
+        # A commit landed while the query ran, so the result may predate it
+        if self.current_version() != version:
+            return
+        key = (version, key)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        self.watcher.close()
+
+
+def table_exists(conn, table):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def page_of_urls(conn, pattern, after, limit):
+    # Keyset pagination: seek past the last id seen instead of using OFFSET
+    rows = conn.execute(
+        "SELECT id, sitemap_url, downloaded FROM all_sitemaps "
+        "WHERE sitemap_url LIKE ? ESCAPE '\\' AND id > ? ORDER BY id LIMIT ?",
+        (pattern, after, limit + 1),
+    ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def url_slug(url, marker):
+    return url.split(marker, 1)[1].split('?', 1)[0].strip('/')
+
+
+def query_companies(conn, after, limit):
+    rows, more = page_of_urls(conn, '%/empresa/%', after, limit)
+    items = [
+        {
+            'id': row['id'],
+            'url': row['sitemap_url'],
+            'slug': url_slug(row['sitemap_url'], '/empresa/'),
+            'downloaded': bool(row['downloaded']),
+        }
+        for row in rows
+    ]
+    return items, more
+
+
+def query_company_details(conn, after, limit):
+    if not table_exists(conn, 'company_details'):
+        return [], False
+    rows = conn.execute(
+        "SELECT * FROM company_details WHERE id > ? ORDER BY id LIMIT ?",
+        (after, limit + 1),
+    ).fetchall()
+    return [dict(row) for row in rows[:limit]], len(rows) > limit
+
+
+def query_jobs(conn, after, limit):
+    rows, more = page_of_urls(conn, '%/oferta/%', after, limit)
+    items = []
+    for row in rows:
+        job_id, _, slug = url_slug(row['sitemap_url'], '/oferta/').partition('/')
+        items.append({
+            'id': row['id'],
+            'url': row['sitemap_url'],
+            'job_id': int(job_id) if job_id.isascii() and job_id.isdigit() else None,
+            'slug': slug,
+            'downloaded': bool(row['downloaded']),
+        })
+    return items, more
+
+
+def query_job(conn, job_id):
+    row = conn.execute(
+        "SELECT id, sitemap_url, downloaded FROM all_sitemaps WHERE sitemap_url LIKE ? ESCAPE '\\' ORDER BY id LIMIT 1",
+        (f"%/oferta/{job_id}/%",),
+    ).fetchone()
+    if row is None:
+        raise NotFound(f"Job {job_id} not found")
+    return {
+        'id': row['id'],
+        'url': row['sitemap_url'],
+        'job_id': job_id,
+        'slug': url_slug(row['sitemap_url'], f"/oferta/{job_id}/"),
+        'downloaded': bool(row['downloaded']),
+    }
+
+
+def query_search(conn, term, after, limit):
+    rows, more = page_of_urls(conn, f"%{escape_like(term)}%", after, limit)
+    items = [
+        {'id': row['id'], 'url': row['sitemap_url'], 'downloaded': bool(row['downloaded'])}
+        for row in rows
+    ]
+    return items, more
+
+
+def query_stats(conn):
+    row = conn.execute(
+        "SELECT COUNT(*) AS total, "
+        "COALESCE(SUM(downloaded), 0) AS downloaded, "
+        "COALESCE(SUM(sitemap_url LIKE '%/oferta/%'), 0) AS jobs, "
+        "COALESCE(SUM(sitemap_url LIKE '%/empresa/%'), 0) AS companies "
+        "FROM all_sitemaps"
+    ).fetchone()
+    stats = dict(row)
+    stats['sitemaps'] = conn.execute('SELECT COUNT(*) FROM urls').fetchone()[0] if table_exists(conn, 'urls') else 0
+    if table_exists(conn, 'company_details'):
+        stats['company_details'] = conn.execute('SELECT COUNT(*) FROM company_details').fetchone()[0]
+    else:
+        stats['company_details'] = 0
+    return stats
+
+
+def parse_int(params, name, default, minimum=0, maximum=MAX_SQLITE_INT):
+    raw = params.get(name, [None])[0]
+    if raw is None or raw == '':
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise BadRequest(f"Parameter '{name}' must be an integer")
+    if value < minimum:
+        raise BadRequest(f"Parameter '{name}' must be at least {minimum}")
+    return min(value, maximum)
+
+
+def paged(items, more, limit):
+    return {
+        'items': items,
+        'limit': limit,
+        'next_after': items[-1]['id'] if more and items else None,
+    }
+
+
+async def route(pool, path, params):
+    if path == '/stats':
+        return await pool.run(query_stats)
+
+    if path.startswith('/jobs/'):
+        job_id = path[len('/jobs/'):]
+        if not (job_id.isascii() and job_id.isdigit()):
+            raise BadRequest('Job id must be an integer')
+        return await pool.run(query_job, int(job_id))
+
+    listings = {
+        '/companies': query_companies,
+        '/companies/details': query_company_details,
+        '/jobs': query_jobs,
+    }
+    after = parse_int(params, 'after', 0)
+    limit = parse_int(params, 'limit', DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT)
+
+    if path in listings:
+        items, more = await pool.run(listings[path], after, limit)
+        return paged(items, more, limit)
+
+    if path == '/search':
+        term = params.get('q', [''])[0].strip()
+        if not term:
+            raise BadRequest("Parameter 'q' is required")
+        items, more = await pool.run(query_search, term, after, limit)
+        result = paged(items, more, limit)
+        result['q'] = term
+        return result
+
+    raise NotFound(f"No endpoint at {path}")
+
+
+def render(payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return body, etag
+
+
+async def respond(pool, cache, method, target, headers):
+    if method not in ('GET', 'HEAD'):
+        body, _ = render({'error': 'Only GET and HEAD are supported'})
+        return 405, body, None
+
+    parts = urlsplit(target)
+    path = parts.path.rstrip('/') or '/'
+    params = parse_qs(parts.query)
+    # Normalise the query so equivalent requests share a cache entry
+    key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+
+    version, cached = cache.get(key)
+    if cached is None:
+        try:
+            cached = render(await route(pool, path, params))
+        except BadRequest as e:
+            return 400, render({'error': str(e)})[0], None
+        except NotFound as e:
+            return 404, render({'error': str(e)})[0], None
+        cache.put(version, key, cached)
+
+    body, etag = cached
+    if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+        return 304, b'', etag
+    return 200, body, etag
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    content_length = int(headers.get('content-length', 0))
+    if content_length < 0:
+        raise ValueError('Negative Content-Length')
+    return method, target, version, headers, content_length
+
+
+async def write_response(writer, status, body, etag, keep_alive, head_only):
+    lines = [
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+        'Content-Type: application/json; charset=utf-8',
+        'Cache-Control: no-cache',
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    # A 304 has no body, and a Content-Length: 0 would read as an empty representation
+    if status != 304:
+        lines.append(f"Content-Length: {len(body)}")
+    if etag:
+        lines.append(f"ETag: {etag}")
+    if status == 405:
+        lines.append('Allow: GET, HEAD')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    if not head_only and status != 304:
+        writer.write(body)
+    await writer.drain()
+
+
+async def handle_client(pool, cache, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except ValueError:
+                await write_response(writer, 400, render({'error': 'Malformed request'})[0], None, False, False)
+                break
+            if request is None:
+                break
+            method, target, version, headers, content_length = request
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            # Bodies are never used, but they must be consumed or the next request on this connection is misread
+            if 'transfer-encoding' in headers or (content_length and method not in ('GET', 'HEAD')):
+                keep_alive = False
+            elif content_length:
+                await reader.readexactly(content_length)
+            try:
+                status, body, etag = await respond(pool, cache, method, target, headers)
+            except sqlite3.Error as e:
+                logging.error(f"Query failed for {target}: {e} ❌")
+                status, body, etag = 500, render({'error': 'Database error'})[0], None
+            except Exception:
+                logging.exception(f"Request failed for {target} ❌")
+                status, body, etag = 500, render({'error': 'Internal server error'})[0], None
+            logging.info(f"{method} {target} -> {status}")
+            await write_response(writer, status, body, etag, keep_alive, method == 'HEAD')
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(db_path, host, port, pool_size, cache_size):
+    pool = ConnectionPool(db_path, pool_size)
+    cache = ResultCache(db_path, cache_size)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(pool, cache, reader, writer), host, port
+    )
+    logging.info(f"Serving {db_path} on http://{host}:{port} with {pool_size} read connections 🚀")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await pool.close()
+        logging.info(f"Result cache served {cache.hits} hits and {cache.misses} misses 📊")
+        cache.close()
+
+
+def main():
+    logging.info("Script started 🏁")
+    current_dir = os.getcwd()
+    parser = argparse.ArgumentParser(description='Serve the crawl database over a local read-only HTTP API')
+    parser.add_argument('--db', default=os.path.join(current_dir, 'itjobs_pt', 'urls_database.db'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--cache-size', type=int, default=256)
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        logging.error(f"Database not found at {args.db}, run from the repo root or pass --db ❌")
+        raise SystemExit(1)
+
+    enable_wal(args.db)
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.pool_size, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+    logging.info("Script finished successfully ✅")
+
+if __name__ == "__main__":
+    main()